@@ -1,8 +1,6 @@
 import matplotlib.pyplot as plt
-from matplotlib.transforms import Affine2D
-from matplotlib.patches import Rectangle
+from matplotlib.collections import PolyCollection
 import numpy as np
-import itertools
 
 num_rows = 12
 num_cols = 12
@@ -14,19 +12,44 @@ fig, ax = plt.subplots(1, 1, figsize=(5, 5))
 def logit(p):
     return(1/(1+np.exp(-p)))
 
-for r, c in itertools.product(range(num_rows), range(num_cols)):
-    cx = c * (square_size + gap_size)
-    cy = r * (square_size+gap_size)
-    for i in range(square_size):
-        red = logit((r+1)*(10*i+1)/square_size)
-        green = logit((c+1)*(0.05*i+1)/square_size)
-        blue = logit(((r+1)/(c+1))*(0.01*i+1)/square_size+np.random.normal(0, .4))
-        rect = Rectangle((cx + i/2, cy + i/2), square_size - i, square_size-i,
-                         fill=False, angle=c+r,
-                         color=(red, green, blue))
-        ax.add_patch(rect)
+# Lookup table of logit over [-12, 24], outside of which it is flat for our purposes
+lut_min, lut_max, lut_size = -12, 24, 1024
+logit_table = logit(np.linspace(lut_min, lut_max, lut_size))
 
+def logit_lut(p):
+    idx = np.rint((p - lut_min) / (lut_max - lut_min) * (lut_size - 1)).astype(int)
+    return(logit_table[np.clip(idx, 0, lut_size - 1)])
+
+# Row, column and square index for every rectangle, in drawing order
+R, C, I = np.meshgrid(np.arange(num_rows), np.arange(num_cols), np.arange(square_size),
+                      indexing="ij")
+
+# Draw the noise for the blue channel of all rectangles at once
+noise = np.random.normal(0, .4, R.shape)
+
+red = logit_lut((R+1)*(10*I+1)/square_size)
+green = logit_lut((C+1)*(0.05*I+1)/square_size)
+blue = logit_lut(((R+1)/(C+1))*(0.01*I+1)/square_size + noise)
+colors = np.stack((red, green, blue), axis=-1).reshape(-1, 3)
+
+# Lower left corner, side and rotation of each square
+cx = (C * (square_size + gap_size) + I/2).ravel()
+cy = (R * (square_size + gap_size) + I/2).ravel()
+side = (square_size - I).ravel()
+theta = np.deg2rad(C + R).ravel()
+cos, sin = np.cos(theta), np.sin(theta)
+
+# Rotate the corners of the unit square around the lower left corner, giving (N, 4, 2) vertices
+unit_square = np.array([[0, 0], [1, 0], [1, 1], [0, 1]])
+dx = unit_square[:, 0] * side[:, None]
+dy = unit_square[:, 1] * side[:, None]
+verts = np.stack((cx[:, None] + dx * cos[:, None] - dy * sin[:, None],
+                  cy[:, None] + dx * sin[:, None] + dy * cos[:, None]), axis=-1)
+
+# The limits are known in advance, so fix them and skip the data limits update
 ax.set_xlim(-square_size-gap_size, (num_cols + 1) * (square_size + gap_size))
 ax.set_ylim(-square_size-gap_size, (num_rows + 1) * (square_size + gap_size))
+ax.add_collection(PolyCollection(verts, edgecolors=colors, facecolors="none", linewidths=1),
+                  autolim=False)
 ax.axis("off")
 plt.show()
@@ -1,7 +1,80 @@
 from math import ceil
+import numba
 import numpy as np
 import matplotlib.pyplot as plt
-from scipy import interpolate
+from scipy.ndimage import map_coordinates
+
+# Exponent of the inverse-distance weighting for each decay function
+DECAY_EXPONENTS = {"inv_linear": 1, "inv_quadratic": 2, "inv_cubic": 3}
+
+
+@numba.njit(cache=True)
+def trace(field_u: np.ndarray, field_v: np.ndarray, resolution: float, nsize: int, decay_p: int,
+          x0: np.ndarray, y0: np.ndarray, nsteps: int, out: np.ndarray) -> None:
+    """Moves particles through the field, storing their trajectories in out.
+    This is the compiled equivalent of repeatedly calling FlowField.get_vector.
+
+    Args:
+        field_u (np.ndarray): the (cols, rows) array of x components of the field vectors
+        field_v (np.ndarray): the (cols, rows) array of y components of the field vectors
+        resolution (float): the resolution of the field
+        nsize (int): the size of the neighbourhood around the particle
+        decay_p (int): the exponent of the decay function, one of the values in DECAY_EXPONENTS
+        x0 (np.ndarray): the starting x coordinates
+        y0 (np.ndarray): the starting y coordinates
+        nsteps (int): the number of steps to take
+        out (np.ndarray): a (nsteps + 1, N, 2) array to store the trajectories in
+    """
+    n_x = field_u.shape[0]
+    n_y = field_u.shape[1]
+    half = nsize // 2
+
+    for k in range(x0.shape[0]):
+        x = x0[k]
+        y = y0[k]
+        out[0, k, 0] = x
+        out[0, k, 1] = y
+
+        for step in range(1, nsteps + 1):
+            # Cell containing the particle
+            cx = int(np.floor(x / resolution))
+            cy = int(np.floor(y / resolution))
+
+            sum_x = 0.0
+            sum_y = 0.0
+            on_node = False
+            for i in range(cx - half, cx - half + nsize):
+                dx = i * resolution - x
+                # Loop around the edges of the field
+                fi = i % n_x
+                for j in range(cy - half, cy - half + nsize):
+                    dy = j * resolution - y
+                    fj = j % n_y
+                    dist2 = dx * dx + dy * dy
+                    if dist2 == 0.0:
+                        # The particle sits exactly on a vector, just follow that one
+                        sum_x = field_u[fi, fj]
+                        sum_y = field_v[fi, fj]
+                        on_node = True
+                        break
+                    # Work on the squared distance, so inv_quadratic needs no sqrt.
+                    # The branch does not depend on the loop, so the compiler can drop it
+                    if decay_p == 1:
+                        w = 1.0 / np.sqrt(dist2)
+                    elif decay_p == 2:
+                        w = 1.0 / dist2
+                    else:
+                        w = 1.0 / (dist2 * np.sqrt(dist2))
+                    sum_x += field_u[fi, fj] * w
+                    sum_y += field_v[fi, fj] * w
+                if on_node:
+                    break
+
+            x += sum_x
+            y += sum_y
+            out[step, k, 0] = x
+            out[step, k, 1] = y
+
 
 class FlowField:
     """
@@ -9,7 +82,8 @@ class FlowField:
     """
 
     def __init__(self, width: int = 100, height: int = 100, resolution: float = 0.1,
-                neighbourhood_size: int = 3, decay: str = "inv_linear") -> None:
+                neighbourhood_size: int = 3, decay: str = "inv_linear",
+                interpolation: str = "neighbourhood") -> None:
         """Initialize the flow field
 
         Args:
@@ -20,6 +94,9 @@ class FlowField:
                 influenced by the neighbourhood_size x neighbourhood_size neighbourhood of vectors around them.
             decay (str): the decay function to use for the vector influence, defaults to "linear". 
                 Can be one of "inv_linear", "inv_quadratic" or "inv_cubic".
+            interpolation (str): how to get the vector at a point, defaults to "neighbourhood".
+                "neighbourhood" sums the neighbourhood of vectors weighted by the decay function,
+                "bilinear" interpolates the four closest vectors (neighbourhood_size and decay are then ignored).
         """
 
         self.width = width
@@ -32,55 +109,63 @@ class FlowField:
         self.neighbourhood_size = neighbourhood_size
 
         # Ensure the decay function is valid
-        if decay not in {"inv_linear", "inv_quadratic", "inv_cubic"}:
-            print("Invalid decay function, setting to linear")
-            decay = "linear"
+        if decay not in DECAY_EXPONENTS:
+            print("Invalid decay function, setting to inv_linear")
+            decay = "inv_linear"
         self.decay = decay
+        self._decay_p = DECAY_EXPONENTS[decay]
+
+        if interpolation not in {"neighbourhood", "bilinear"}:
+            print("Invalid interpolation, setting to neighbourhood")
+            interpolation = "neighbourhood"
+        self.interpolation = interpolation
 
-        self.field = np.zeros((ceil(width / resolution), ceil(height / resolution), 2))
+        # Coordinates of the field vectors, shared by init_field and draw_field
+        self._grid_x, self._grid_y = np.meshgrid(np.arange(ceil(width / resolution)) * resolution,
+                                                 np.arange(ceil(height / resolution)) * resolution,
+                                                 indexing="ij")
         self.init_field()
 
     def init_field(self, field_fn: callable = None) -> None:
         """Initialise the field with a given function
             
             Args:
-                field_fn (callable): the function to initialise the field with. Defaults to None (in which case get_vector is used).
+                field_fn (callable): the function to initialise the field with. It is called once with the
+                    2D arrays of x and y coordinates and must return a (cols, rows, 2) array of vectors.
+                    Defaults to None (in which case __gen_vector is used).
         """
         
         if field_fn is None:
             field_fn = self.__gen_vector
 
-        # Create a grid of x and y coordinates
-        x, y = np.meshgrid(np.arange(0, self.width, self.resolution),
-                           np.arange(0, self.height, self.resolution))
+        # Get the vector at each x,y coordinate. The two components are stored as separate
+        # contiguous float32 arrays, which halves the memory traffic when sampling the field
+        field = np.asarray(field_fn(self._grid_x, self._grid_y))
+        self.field_u = np.ascontiguousarray(field[:, :, 0], dtype=np.float32)
+        self.field_v = np.ascontiguousarray(field[:, :, 1], dtype=np.float32)
 
-        # Get the vector at each x,y coordinate
-        field = np.array([field_fn(x, y) for (x, y) in zip(x.flatten(), y.flatten())])
-        # Reshape the field to match the grid
-        self.field = field.reshape(self.field.shape)
+    @property
+    def field(self) -> np.ndarray:
+        """The (cols, rows, 2) array of field vectors"""
+        return np.stack((self.field_u, self.field_v), axis=-1)
 
-    def __gen_vector(self, x: float, y: float) -> np.ndarray:
+    def __gen_vector(self, x: np.ndarray, y: np.ndarray) -> np.ndarray:
         """
-        Generates a flow-
+        Generates the default flow field
 
         Args:
-            x (float): the x coordinate
-            y (float): the y coordinate
+            x (np.ndarray): the x coordinates
+            y (np.ndarray): the y coordinates
 
         Returns:
-            np.ndarray: the vector at the given coordinates
+            np.ndarray: the vectors at the given coordinates, stacked along the last axis
         """
 
         x = 2 * np.pi * np.sin(x) + y
         y = 2 * np.pi * np.cos(y) + x
 
-        # Check if the coordinates are within the field, otherwise loop around
-        if x < 0 or x >= self.width:
-            x %= self.width
-        if y < 0 or y >= self.height:
-            y %= self.height
-
-        return [x, y] 
+        # Loop around the edges of the field
+        return np.stack([x % self.width, y % self.height], axis=-1)
 
     def draw_field(self, color: str = 'black') -> None:
         """Draws the vector field
@@ -88,11 +173,8 @@ class FlowField:
         Args:
             color (str, optional): The color of the vectors. Defaults to 'black'.
         """
-        x, y = np.meshgrid(np.arange(0, self.width, self.resolution),
-                           np.arange(0, self.height, self.resolution))
-
         fig, ax = plt.subplots(1, 1, figsize=(8, 8))
-        ax.quiver(x.flatten(), y.flatten(), self.field[:, :, 0], self.field[:, :, 1], color=color)
+        ax.quiver(self._grid_x, self._grid_y, self.field_u, self.field_v, color=color)
         ax.axis('equal')
         ax.axis('off')
         plt.show()
@@ -100,7 +182,8 @@ class FlowField:
     def get_vector(self, x: float, y: float) -> np.ndarray:
         """
         Get the compount vector at the given coordinates. We sum the neighborhood of 
-        the given coordinates weighted by the decay function.
+        the given coordinates weighted by the decay function, or interpolate the field
+        bilinearly if the field uses "bilinear" interpolation.
 
         Args:
             x (float): the x coordinate
@@ -110,51 +193,108 @@ class FlowField:
             np.ndarray: the vector at the given coordinates
         """
 
-        # Find the neighbourhood of the given coordinates
-        x_min = int(x - self.neighbourhood_size / 2)
-        x_max = int(x + self.neighbourhood_size / 2)
-        y_min = int(y - self.neighbourhood_size / 2)
-        y_max = int(y + self.neighbourhood_size / 2)
-
-        # Check if the coordinates are within the field, otherwise loop around
-        if x_min < 0 or x_max >= self.width:
-            x_min %= self.width
-            x_max %= self.width
-        if y_min < 0 or y_max >= self.height:
-            y_min %= self.height
-            y_max %= self.height
-
-        # Get the neighbourhood of vectors
-        vectors = self.field[x_min:x_max, y_min:y_max, :]
-        # Get the neighbourhood of x and y coordinates
-        x_coords = np.arange(x_min, x_max) * self.resolution
-        y_coords = np.arange(y_min, y_max) * self.resolution
-
-        # Get the distance of each vector from the given coordinates
-        distances = np.sqrt((x_coords - x) ** 2 + (y_coords - y) ** 2)
+        return self.get_vector_batch(np.array([x]), np.array([y]))[0]
+
+    def get_vector_batch(self, x: np.ndarray, y: np.ndarray) -> np.ndarray:
+        """
+        Get the compound vectors at many coordinates at once. See get_vector.
+
+        Args:
+            x (np.ndarray): the x coordinates
+            y (np.ndarray): the y coordinates
+
+        Returns:
+            np.ndarray: the (N, 2) array of vectors at the given coordinates
+        """
+
+        if self.interpolation == "bilinear":
+            return self.__sample_bilinear(x, y)
+
+        # Find the neighbourhood of each of the given coordinates, in cell units
+        offsets = np.arange(self.neighbourhood_size) - self.neighbourhood_size // 2
+        x_idx = np.floor(x / self.resolution).astype(int)[:, None] + offsets
+        y_idx = np.floor(y / self.resolution).astype(int)[:, None] + offsets
+
+        # Get the (N, size, size) neighbourhoods of vectors, looping around the edges of the field
+        n_x, n_y = self.field_u.shape
+        flat_idx = (x_idx % n_x)[:, :, None] * n_y + (y_idx % n_y)[:, None, :]
+        u = np.take(self.field_u, flat_idx)
+        v = np.take(self.field_v, flat_idx)
+
+        # Get the squared distance of each vector from the given coordinates
+        distances2 = ((x_idx * self.resolution - x[:, None]) ** 2)[:, :, None] + \
+                     ((y_idx * self.resolution - y[:, None]) ** 2)[:, None, :]
         # Get the weights for each vector
-        weights = self.__get_weights(distances)
+        on_node = distances2 == 0
+        with np.errstate(divide="ignore"):
+            weights = self.__get_weights(distances2)
+        # Points exactly on a vector just follow that one
+        weights = np.where(on_node.any(axis=(1, 2))[:, None, None], on_node, weights)
 
-        # Sum the vectors weighted by the weights
-        return np.sum(vectors * weights, axis=(0, 1))
+        # Sum the vectors weighted by the weights, without building the weighted neighbourhoods
+        return np.column_stack((np.einsum("nij,nij->n", u, weights),
+                                np.einsum("nij,nij->n", v, weights)))
 
-    def __get_weights(self, distances: np.ndarray) -> np.ndarray:
+    def advance(self, positions: np.ndarray, n_steps: int) -> np.ndarray:
         """
-        Get the weights for the given distances
+        Move particles through the field, all together.
 
         Args:
-            distances (np.ndarray): the distances to get the weights for
+            positions (np.ndarray): the (N, 2) array of starting positions
+            n_steps (int): the number of steps to take
+
+        Returns:
+            np.ndarray: the (n_steps + 1, N, 2) array of positions, starting with the given ones
+        """
+
+        positions = np.asarray(positions, dtype=np.float32).reshape(-1, 2)
+        out = np.empty((n_steps + 1, len(positions), 2), dtype=np.float32)
+
+        if self.interpolation == "bilinear":
+            out[0] = positions
+            for step in range(1, n_steps + 1):
+                out[step] = out[step - 1] + self.get_vector_batch(out[step - 1, :, 0], out[step - 1, :, 1])
+        else:
+            trace(self.field_u, self.field_v, self.resolution, self.neighbourhood_size, self._decay_p,
+                  positions[:, 0].copy(), positions[:, 1].copy(), n_steps, out)
+
+        return out
+
+    def __sample_bilinear(self, x: np.ndarray, y: np.ndarray) -> np.ndarray:
+        """
+        Bilinearly interpolate the field at the given coordinates, looping around the edges
+
+        Args:
+            x (np.ndarray): the x coordinates
+            y (np.ndarray): the y coordinates
+
+        Returns:
+            np.ndarray: the (N, 2) array of vectors at the given coordinates
+        """
+
+        # map_coordinates works in cell units; grid-wrap is the periodic mode
+        coords = np.array([x, y], dtype=float) / self.resolution
+        u = map_coordinates(self.field_u, coords, order=1, mode="grid-wrap")
+        v = map_coordinates(self.field_v, coords, order=1, mode="grid-wrap")
+        return np.column_stack((u, v))
+
+    def __get_weights(self, distances2: np.ndarray) -> np.ndarray:
+        """
+        Get the weights for the given squared distances
+
+        Args:
+            distances2 (np.ndarray): the squared distances to get the weights for
 
         Returns:
             np.ndarray: the weights for the given distances
         """
 
-        if self.decay == "inv_linear":
-            return 1 / distances
-        elif self.decay == "inv_quadratic":
-            return 1 / distances ** 2
-        elif self.decay == "inv_cubic":
-            return 1 / distances ** 3
+        if self._decay_p == 1:
+            return 1 / np.sqrt(distances2)
+        elif self._decay_p == 2:
+            return 1 / distances2
+        else:
+            return distances2 ** -1.5
 
     def __str__(self) -> str:
         """_summary_ of the flow field
@@ -167,6 +307,7 @@ class FlowField:
 class Particle:
     """
     A class to represent a particle. Particles get moved around by the flow field.
+    To move many particles at once use FlowField.advance, the particle just holds the results.
     """
 
     def __init__(self, x:float = 0.0, y:float = 0.0, lifespan:int = 100, color:str = "black") -> None:
@@ -183,7 +324,9 @@ class Particle:
         self.y = y
         self.lifespan = lifespan
         self.color = color
-        self.pos = np.array([x, y])
+        # Preallocate the trajectory, the first row is the starting position
+        self.pos = np.empty((lifespan + 1, 2))
+        self.pos[0] = (x, y)
         
     def flow_particle(self, field:FlowField) -> None:
         """
@@ -192,25 +335,24 @@ class Particle:
 
         Args:
             field (FlowField): The flow field to use.
-            n_steps (int, optional): The number of steps to take. Defaults to 100.
         """
 
-        for _ in range(self.lifespan):
-            # Get the sum of the vectors in the neighbourhood around the particle
-            vector = field.get_vector(self.x, self.y)
-            # Move the particle according to the vector and append the new position to the list            
-            self.x += vector[0]
-            self.y += vector[1]
-            self.pos = np.vstack((self.pos, np.array([self.x, self.y])))            
+        self.pos[:] = field.advance(self.pos[:1], self.lifespan)[:, 0]
+        self.x, self.y = self.pos[-1]
 
 
 ff = FlowField(1, 1, 0.05)
 #ff.draw_field()
 n_particles = 3
+lifespan = 100
 x = np.random.randint(0, 10, n_particles)
 y = np.random.randint(0, 10, n_particles)
-particles = [Particle(x[i], y[i], lifespan=100) for i in range(n_particles)]
+particles = [Particle(x[i], y[i], lifespan=lifespan) for i in range(n_particles)]
+
+# Move all the particles together
+trajectories = ff.advance(np.column_stack((x, y)), lifespan)
 
-for p in particles:
-    p.flow_particle(ff)
+for i, p in enumerate(particles):
+    p.pos[:] = trajectories[:, i]
+    p.x, p.y = p.pos[-1]
     print(p.pos)
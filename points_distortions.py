@@ -1,3 +1,4 @@
+import numexpr as ne
 import numpy as np
 import matplotlib.pyplot as plt
 from matplotlib.patches import Circle
@@ -5,21 +6,43 @@ from collections.abc import Callable
 from typing import Any
 
 
+def vectorized(func: Callable) -> Callable:
+    """Marks a function as working on the whole grid at once, rather than on a single point.
+    Vectorized functions take the arrays of x and y coordinates as their first two arguments.
+
+    Args:
+        func (Callable): The function to mark
+
+    Returns:
+        Callable: The same function
+    """
+    func._vectorized = True
+    return func
+
+
 class PointGrid:
     """A class to represent a grid of points, that can be transformed in various ways.
     """
 
     def __init__(self, width=100, height=100):
-        coords = [[x, y] for x in range(width) for y in range(height)]
         self.height = height
         self.width = width
-        self.grid = np.array(coords, dtype=float)
-        self.colour = ["gray" for x in range(width) for y in range(height)]
-        self.ptsize = [1 for x in range(width) for y in range(height)]
+        # Coordinates are kept as two contiguous arrays rather than an (N, 2) array
+        x, y = np.meshgrid(np.arange(width), np.arange(height), indexing="ij")
+        self.x = x.ravel().astype(float)
+        self.y = y.ravel().astype(float)
+        # RGB colour and size of each point, defaulting to gray points of size 1
+        self.colour = np.full((width * height, 3), 0.5)
+        self.ptsize = np.ones(width * height)
 
     def __str__(self):
         return f"A PointGrid object of {self.height} x {self.width} points."
 
+    @property
+    def grid(self) -> np.array:
+        """The (N, 2) array of point coordinates"""
+        return np.column_stack((self.x, self.y))
+
     def ident(self, x: np.array) -> np.array:
         """The identity function
 
@@ -35,85 +58,108 @@ class PointGrid:
         """Transforms the grid points
 
         Args:
-            func (Callable[..., np.array], optional): The function to apply to the x coordinates of the grid points. The function takes at least one single argument containing the coordinates and returns the transformed coordinates. Defaults to the identity function.
+            func (Callable[..., np.array], optional): The function to apply to the x coordinates of the grid points. The function takes at least one single argument containing the coordinates and returns the transformed coordinates. Functions marked with @vectorized are called once as func(x, y, *args) and return the new x and y arrays. Defaults to the identity function.
             *args: any additional arguments to pass to func
         """
-        res = self.grid.copy()
+        if getattr(func, "_vectorized", False):
+            x, y = func(self.x, self.y, *args)
+            self.x = np.asarray(x, dtype=float)
+            self.y = np.asarray(y, dtype=float)
+            return
+
+        res = self.grid
 
-        for i, pt in enumerate(self.grid):
+        for i, pt in enumerate(res):
             res[i] = func(pt, *args)
 
-        self.grid = res
+        self.x = res[:, 0].copy()
+        self.y = res[:, 1].copy()
 
     def map_color(self, func: Callable, *args) -> None:
         """Sets the colour of each point according to a function
 
         Args:
-            func (Callable): A function to apply to each point, which will return a colour. The function takes at least one single argument containing the coordinates and returns the colour.
+            func (Callable): A function to apply to each point, which will return a colour. The function takes at least one single argument containing the coordinates and returns the colour as RGB. Functions marked with @vectorized are called once as func(x, y, *args) and return an (N, 3) array.
             *args: any additional arguments to pass to func
         """
+        if getattr(func, "_vectorized", False):
+            self.colour = np.asarray(func(self.x, self.y, *args), dtype=float)
+            return
+
+        grid = self.grid
         for i in range(len(self.colour)):
-            self.colour[i] = func(self.grid[i], *args)
+            self.colour[i] = func(grid[i], *args)
 
     def map_size(self, func: Callable[..., float], *args) -> None:
         """Sets the size of each point according to a function
 
         Args:
-            func (Callable): A function to apply to each point, which will return a size. The function takes at least one single argument containing the coordinates and returns the colour.
+            func (Callable): A function to apply to each point, which will return a size. The function takes at least one single argument containing the coordinates and returns the colour. Functions marked with @vectorized are called once as func(x, y, *args).
             *args: any additional arguments to pass to func
         """
+        if getattr(func, "_vectorized", False):
+            self.ptsize = np.asarray(func(self.x, self.y, *args), dtype=float)
+            return
+
+        grid = self.grid
         for i in range(len(self.ptsize)):
-            self.ptsize[i] = func(self.grid[i], *args)
+            self.ptsize[i] = func(grid[i], *args)
 
     def plot(self, alpha=0.5, ax=None):
         if ax is None:
             fig, ax = plt.subplots()
 
-        ax.scatter(x=self.grid[:, 0], y=self.grid[:, 1],
+        ax.scatter(x=self.x, y=self.y,
                    s=self.ptsize, alpha=alpha, color=self.colour)
         ax.axis("off")
 
 
-def cart2pol(coords):
-    x, y = coords
+@vectorized
+def cart2pol(x, y):
     rho = np.sqrt(x**2 + y**2)
     phi = np.arctan2(y, x)
-    return([rho, phi])
+    return(rho, phi)
 
 
-def pol2cart(coords):
-    rho, theta = coords
+@vectorized
+def pol2cart(rho, theta):
     x = rho * np.cos(theta)
     y = rho * np.sin(theta)
-    return([x, y])
+    return(x, y)
 
 
-def jitter(coords: np.array, amount: float) -> np.array:
-    return(coords + np.random.normal(scale=amount, size=2))
+@vectorized
+def jitter(x: np.array, y: np.array, amount: float) -> tuple:
+    return(x + np.random.normal(scale=amount, size=np.shape(x)),
+           y + np.random.normal(scale=amount, size=np.shape(y)))
 
 
-def scale(coords: np.array, amount: float) -> np.array:
-    return(coords * amount)
+@vectorized
+def scale(x: np.array, y: np.array, amount: float) -> tuple:
+    return(x * amount, y * amount)
 
 
-def transform1(coords: np.array, a: float, b: float, c: float, d: float) -> np.array:
-    x, y = coords
-    x = a * np.sin(x) + b * np.cos(y) + c * np.sin(x / y)
-    y = a * np.cos(x) + d * np.sin(y)
-    coords = [x, y]
-    return(coords)
+@vectorized
+def transform1(x: np.array, y: np.array, a: float, b: float, c: float, d: float) -> tuple:
+    # numexpr evaluates each expression in a single pass, without temporary arrays
+    x = ne.evaluate("a * sin(x) + b * cos(y) + c * sin(x / y)",
+                    local_dict={"x": x, "y": y, "a": a, "b": b, "c": c})
+    y = ne.evaluate("a * cos(x) + d * sin(y)", local_dict={"x": x, "y": y, "a": a, "d": d})
+    return(x, y)
 
 
-def color_fun(coords: np.array, a: float, b: float, c: float, d: float):
-    coords = coords / 4
-    r = 0.5 * (np.sin(a*coords[1]) + 1)
-    g = 0.5 * (np.cos(b*coords[0]) + 1)
-    b = 0.5 * (np.sin(c*coords[0] - d*coords[1]) + 1)
-    return ((r, g, b))
+@vectorized
+def color_fun(x: np.array, y: np.array, a: float, b: float, c: float, d: float):
+    variables = {"x": x, "y": y, "a": a, "b": b, "c": c, "d": d}
+    r = ne.evaluate("0.5 * (sin(a * y / 4) + 1)", local_dict=variables)
+    g = ne.evaluate("0.5 * (cos(b * x / 4) + 1)", local_dict=variables)
+    b = ne.evaluate("0.5 * (sin((c * x - d * y) / 4) + 1)", local_dict=variables)
+    return (np.stack([r, g, b], axis=-1))
 
 
-def size_fun(coords: np.array):
-    return coords[0] * coords[1] + .4
+@vectorized
+def size_fun(x: np.array, y: np.array):
+    return x * y + .4
 
 
 tr_params = [[a, 2, 1, .4] for a in np.linspace(0.2, -0.3, 6)]
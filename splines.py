@@ -1,12 +1,14 @@
 from scipy import interpolate
 import matplotlib.pyplot as plt
+from matplotlib.collections import LineCollection
 import numpy as np
-from tqdm import tqdm
+
+rng = np.random.default_rng()
 
 npoints = 8
 n_lines = 500
-x = np.linspace(0, 100, npoints) + np.random.normal(0, 2)
-y = np.random.choice(range(100), size=len(x)).astype(float)
+x = np.linspace(0, 100, npoints) + rng.normal(0, 2)
+y = rng.choice(100, size=len(x)).astype(float)
 x = x.reshape((npoints, 1))
 y = y.reshape((npoints, 1))
 nodes = np.concatenate((x, y), axis=1)
@@ -17,19 +19,24 @@ fig.patch.set_facecolor('black')
 y_displacement = 50
 y_offset = 0.1
 
-for i in tqdm(range(n_lines)):
-    x = nodes[:, 0]
-    y = nodes[:, 1]
+# Nodes of all the lines, one line per row
+x_all = nodes[:, 0] + rng.standard_normal((n_lines, 1)) * .5
+y_all = nodes[:, 1] + np.arange(n_lines)[:, None] * y_offset + \
+    np.abs(rng.standard_normal((n_lines, npoints)) * y_displacement)
 
-    x = x + np.random.normal(0, .5)
-    y = y + i * y_offset + np.abs(np.random.normal(0, y_displacement, size=len(y)))
+# All lines go through npoints nodes at the same parameter values, so evaluating the
+# interpolating cubic spline is a fixed linear map of the nodes: (100, npoints) basis matrix
+u = np.linspace(0, 1, npoints)
+u_eval = np.linspace(0, 1, 100)
+basis = interpolate.make_interp_spline(u, np.eye(npoints), k=3)(u_eval)
 
-    tck, u = interpolate.splprep([x, y], s=0)
-    xnew, ynew = interpolate.splev(np.linspace(0, 1, 100), tck, der=0)
+# Evaluate all the lines at once, giving (n_lines, 100, 2) segments
+segments = np.stack((x_all @ basis.T, y_all @ basis.T), axis=-1)
 
-    # set background to black
-    ax.plot(xnew, ynew, color="white", linewidth=0.1)
+# Limits are set explicitly, so skip the data limits update of the collection
+ax.add_collection(LineCollection(segments, colors="white", linewidths=0.1), autolim=False)
 
 ax.set_xlim(0, 100)
+ax.set_ylim(segments[..., 1].min(), segments[..., 1].max())
 ax.axis("off")
 plt.show()